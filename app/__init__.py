@@ -23,10 +23,21 @@ HOST = os.getenv("HOST", "0.0.0.0")
 PORT = int(os.getenv("PORT", 5000))
 SECRET_KEY = os.getenv("SECRET_KEY", "dev-secret-key-change-in-production")
 JWT_SECRET_KEY = os.getenv("JWT_SECRET_KEY", "jwt-secret-key-change-in-production")
+ASSETS_CDN_FALLBACK = os.getenv("ASSETS_CDN_FALLBACK", "True").lower() == "true"
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "False").lower() == "true"
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", 0))
+PROFILE_MAX_CAPTURES = int(os.getenv("PROFILE_MAX_CAPTURES", 200))
+PROFILE_SQL_PARAMS = os.getenv("PROFILE_SQL_PARAMS", "False").lower() == "true"
+ROSTER_SNAPSHOT = os.getenv("ROSTER_SNAPSHOT", "False").lower() == "true"
+ROSTER_REFRESH_INTERVAL = float(os.getenv("ROSTER_REFRESH_INTERVAL", 1.0))  # Seconds
+ROSTER_CHANGE_RETENTION = int(os.getenv("ROSTER_CHANGE_RETENTION", 3600))  # Seconds
 
 # Create Flask app
 app = Flask(__name__)
 
+# Profile captures are written under instance/profiles by default
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(app.instance_path, 'profiles'))
+
 # Configure Flask app
 app.config['SECRET_KEY'] = SECRET_KEY
 app.config['DEBUG'] = DEBUG
@@ -50,7 +61,7 @@ login_manager.login_view = 'web_login'
 login_manager.login_message = 'Please log in to access this page.'
 login_manager.login_message_category = 'info'
 
-from app import routes, models
+from app import routes, models, assets, profiling, roster
 
 # Flask-Login user loader
 from app.models import User
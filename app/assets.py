@@ -0,0 +1,340 @@
+"""
+Alliance Management System - Static Asset Pipeline
+Vendor third-party assets, fingerprint them and serve them with long-lived caching
+"""
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import posixpath
+import re
+import shutil
+import tempfile
+import urllib.request
+
+import click
+from flask import abort, request, send_file, url_for
+from flask.cli import AppGroup
+
+from app import app, ASSETS_CDN_FALLBACK
+
+try:
+    import brotli  # Optional - enables precompressed .br variants
+except ImportError:
+    brotli = None
+
+# Third-party assets vendored under static/ (local path -> upstream URL)
+VENDOR_ASSETS = {
+    'vendor/bootstrap/css/bootstrap.min.css':
+        'https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/css/bootstrap.min.css',
+    'vendor/bootstrap/js/bootstrap.bundle.min.js':
+        'https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/js/bootstrap.bundle.min.js',
+    'vendor/bootstrap-icons/bootstrap-icons.css':
+        'https://cdn.jsdelivr.net/npm/bootstrap-icons@1.11.0/font/bootstrap-icons.css',
+    'vendor/bootstrap-icons/fonts/bootstrap-icons.woff2':
+        'https://cdn.jsdelivr.net/npm/bootstrap-icons@1.11.0/font/fonts/bootstrap-icons.woff2',
+    'vendor/bootstrap-icons/fonts/bootstrap-icons.woff':
+        'https://cdn.jsdelivr.net/npm/bootstrap-icons@1.11.0/font/fonts/bootstrap-icons.woff',
+}
+
+# Only text formats benefit from precompression (fonts are already compressed)
+COMPRESSIBLE_EXTENSIONS = {'.css', '.js', '.svg', '.json', '.txt', '.map'}
+
+# Matches url(...) references inside CSS files
+CSS_URL_RE = re.compile(r'url\(\s*([\'"]?)([^\'")]+)\1\s*\)')
+
+ONE_YEAR = 60 * 60 * 24 * 365
+
+app.config.setdefault('ASSETS_DIST_DIR', os.path.join(app.static_folder, 'dist'))
+app.config.setdefault('ASSETS_URL_PATH', '/assets')
+
+# Manifest cache: (mtime it was read at, logical -> hashed names, servable hashed names)
+_manifest = (None, {}, frozenset())
+
+
+def _manifest_path():
+    """Location of the manifest mapping logical names to fingerprinted names"""
+    return os.path.join(app.config['ASSETS_DIST_DIR'], 'manifest.json')
+
+
+def _read_manifest():
+    """Reload the manifest whenever it changes on disk (e.g. after `flask assets build`)"""
+    global _manifest
+    try:
+        mtime = os.stat(_manifest_path()).st_mtime_ns
+    except OSError:
+        mtime = None
+
+    if mtime != _manifest[0]:
+        data = {}
+        if mtime is not None:
+            with open(_manifest_path(), encoding='utf-8') as f:
+                data = json.load(f)
+        _manifest = (mtime, data.get('assets', {}), frozenset(data.get('files', ())))
+    return _manifest
+
+
+def load_manifest():
+    """Current logical -> fingerprinted name mapping, empty if assets were never built"""
+    return _read_manifest()[1]
+
+
+def servable_files():
+    """Every fingerprinted file still on disk - older builds stay valid for cached pages"""
+    return _read_manifest()[2]
+
+
+def _fingerprint(path, content):
+    """Insert a short content hash before the extension: a/b.css -> a/b.1a2b3c4d5e.css"""
+    digest = hashlib.sha256(content).hexdigest()[:10]
+    base, ext = posixpath.splitext(path)
+    return f'{base}.{digest}{ext}'
+
+
+def _rewrite_css_urls(css_path, hashed_css_path, content, manifest):
+    """Point url(...) references in a CSS file at the fingerprinted files"""
+    css_dir = posixpath.dirname(css_path)
+    hashed_dir = posixpath.dirname(hashed_css_path)
+
+    def replace(match):
+        quote, ref = match.group(1), match.group(2).strip()
+        if ref.startswith(('data:', 'http:', 'https:', '//', '#', '/')):
+            return match.group(0)
+
+        # Drop cache-busting query strings, the content hash replaces them
+        ref_path, _, fragment = ref.partition('#')
+        ref_path = ref_path.split('?', 1)[0]
+        target = posixpath.normpath(posixpath.join(css_dir, ref_path))
+        if target not in manifest:
+            return match.group(0)
+
+        new_ref = posixpath.relpath(manifest[target], hashed_dir)
+        if fragment:
+            new_ref = f'{new_ref}#{fragment}'
+        return f'url({quote}{new_ref}{quote})'
+
+    text = content.decode('utf-8')
+    return CSS_URL_RE.sub(replace, text).encode('utf-8')
+
+
+def _write_compressed(dest, content):
+    """Write .gz (and .br when available) siblings of a built asset"""
+    with open(dest + '.gz', 'wb') as f:
+        f.write(gzip.compress(content, compresslevel=9, mtime=0))
+    if brotli is not None:
+        with open(dest + '.br', 'wb') as f:
+            f.write(brotli.compress(content, quality=11))
+
+
+def _static_sources():
+    """Paths (relative to static/) of every file the pipeline fingerprints"""
+    static_dir = app.static_folder
+    dist_dir = app.config['ASSETS_DIST_DIR']
+    sources = []
+    for root, dirs, files in os.walk(static_dir):
+        # Never re-process our own output
+        dirs[:] = [d for d in dirs if os.path.join(root, d) != dist_dir]
+        for name in files:
+            if name.startswith('.tmp-'):
+                continue  # Unfinished download
+            full_path = os.path.join(root, name)
+            sources.append(os.path.relpath(full_path, static_dir).replace(os.sep, '/'))
+    return sources
+
+
+def assets_outdated():
+    """True if the manifest is missing or older than any file in static/"""
+    sources = _static_sources()
+    if not sources:
+        return False
+    try:
+        built = os.stat(_manifest_path()).st_mtime
+    except OSError:
+        return True
+    return any(os.stat(os.path.join(app.static_folder, path)).st_mtime > built
+               for path in sources)
+
+
+def build_assets():
+    """
+    Fingerprint every file in static/ into the dist directory and swap in a new manifest.
+    Files from earlier builds are kept so pages rendered against them keep working.
+    """
+    static_dir = app.static_folder
+    dist_dir = app.config['ASSETS_DIST_DIR']
+    sources = _static_sources()
+
+    # CSS last so its url(...) references can be rewritten to hashed names
+    sources.sort(key=lambda path: (path.endswith('.css'), path))
+
+    manifest = {}
+    for path in sources:
+        with open(os.path.join(static_dir, path), 'rb') as f:
+            content = f.read()
+
+        if path.endswith('.css'):
+            # Hash after rewriting so the name changes when a referenced file changes
+            provisional = _fingerprint(path, content)
+            content = _rewrite_css_urls(path, provisional, content, manifest)
+
+        hashed_path = _fingerprint(path, content)
+        dest = os.path.join(dist_dir, hashed_path)
+        # Same name means same content - a file from an earlier build can be reused
+        if not os.path.exists(dest):
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            _write_atomic(dest, content)
+            if posixpath.splitext(path)[1] in COMPRESSIBLE_EXTENSIONS:
+                _write_compressed(dest, content)
+
+        manifest[path] = hashed_path
+
+    files = set(manifest.values())
+    files.update(name for name in servable_files()
+                 if os.path.isfile(os.path.join(dist_dir, name)))
+
+    os.makedirs(dist_dir, exist_ok=True)
+    data = {'assets': manifest, 'files': sorted(files)}
+    _write_atomic(_manifest_path(), json.dumps(data, indent=2, sort_keys=True).encode('utf-8'))
+    return manifest
+
+
+def _write_atomic(dest, content):
+    """Write to a temporary file and move it into place, so readers never see partial files"""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(dest), prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(content)
+        os.replace(tmp_path, dest)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def fetch_vendor_assets(force=False):
+    """
+    Download the pinned third-party assets into static/vendor.
+    Raises OSError (including urllib's URLError) if a download fails.
+    """
+    fetched = []
+    for path, source_url in VENDOR_ASSETS.items():
+        dest = os.path.join(app.static_folder, path)
+        if os.path.exists(dest) and not force:
+            continue
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+
+        # Download next to the target and only move it into place once complete
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(dest), prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f, urllib.request.urlopen(source_url, timeout=30) as response:
+                shutil.copyfileobj(response, f)
+            os.replace(tmp_path, dest)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        fetched.append(path)
+    return fetched
+
+
+def missing_vendor_assets():
+    """Vendored files that have not been fetched yet"""
+    return [path for path in VENDOR_ASSETS
+            if not os.path.exists(os.path.join(app.static_folder, path))]
+
+
+def asset_url(endpoint, **values):
+    """
+    Drop-in replacement for url_for in templates.
+    Static files resolve to their fingerprinted URL once assets are built;
+    anything else is passed straight through to url_for.
+    """
+    if endpoint != 'static':
+        return url_for(endpoint, **values)
+
+    filename = values.get('filename')
+    hashed = load_manifest().get(filename)
+    if hashed:
+        values['filename'] = hashed
+        return url_for('asset', **values)
+
+    # Vendor files not fetched yet - use the upstream copy unless disabled
+    if (ASSETS_CDN_FALLBACK and filename in VENDOR_ASSETS
+            and not os.path.exists(os.path.join(app.static_folder, filename))):
+        return VENDOR_ASSETS[filename]
+
+    return url_for('static', **values)
+
+
+app.jinja_env.globals['asset_url'] = asset_url
+
+if missing_vendor_assets():
+    if ASSETS_CDN_FALLBACK:
+        app.logger.warning('Vendored assets missing - loading them from the CDN '
+                           'until `flask assets fetch` is run')
+    else:
+        app.logger.warning('Vendored assets missing and ASSETS_CDN_FALLBACK is off - '
+                           'pages will be unstyled until `flask assets fetch` is run')
+
+# Build on startup so a deploy never silently serves unfingerprinted files
+if assets_outdated():
+    try:
+        build_assets()
+    except OSError:
+        app.logger.warning('Could not build static assets - serving them from /static '
+                           'without fingerprints or long-lived caching', exc_info=True)
+
+
+@app.route(app.config['ASSETS_URL_PATH'] + '/<path:filename>')
+def asset(filename):
+    """Serve a fingerprinted asset, preferring a precompressed variant"""
+    # Only fingerprinted names - never the manifest or the raw .gz/.br files
+    if filename not in servable_files():
+        abort(404)
+    path = os.path.join(app.config['ASSETS_DIST_DIR'], filename)
+    if not os.path.isfile(path):
+        abort(404)
+
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    encoding = None
+    for candidate, suffix in (('br', '.br'), ('gzip', '.gz')):
+        if request.accept_encodings[candidate] and os.path.isfile(path + suffix):
+            encoding, path = candidate, path + suffix
+            break
+
+    response = send_file(path, mimetype=mimetype, conditional=True, etag=True)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Vary'] = 'Accept-Encoding'
+    # Names change whenever content changes, so the file never needs revalidating
+    response.headers['Cache-Control'] = f'public, max-age={ONE_YEAR}, immutable'
+    return response
+
+
+# CLI: flask assets fetch / flask assets build
+assets_cli = AppGroup('assets', help='Manage vendored static assets.')
+
+
+@assets_cli.command('fetch')
+@click.option('--force', is_flag=True, help='Re-download files that already exist.')
+def fetch_command(force):
+    """Download vendored third-party assets into static/vendor"""
+    try:
+        fetched = fetch_vendor_assets(force=force)
+    except OSError as err:
+        raise click.ClickException(f'Download failed: {err}')
+    click.echo(f'Fetched {len(fetched)} file(s)')
+
+
+@assets_cli.command('build')
+def build_command():
+    """Fingerprint and precompress static assets into static/dist"""
+    missing = missing_vendor_assets()
+    if missing:
+        click.echo(f'Warning: {len(missing)} vendor file(s) missing - run `flask assets fetch` first')
+    manifest = build_assets()
+    if brotli is None:
+        click.echo('brotli not installed - skipping .br variants')
+    click.echo(f'Built {len(manifest)} asset(s)')
+
+
+app.cli.add_command(assets_cli)
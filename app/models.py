@@ -38,6 +38,20 @@ class Member(db.Model):
         return f'<Member {self.name}>'
 
 
+class RosterChange(db.Model):
+    """Change log for members and users - its id is the version used to refresh roster snapshots"""
+    __tablename__ = 'roster_changes'
+
+    id = db.Column(db.Integer, primary_key=True)
+    # No FKs - deleted rows are logged too. Exactly one of the two is set.
+    member_id = db.Column(db.Integer)
+    user_id = db.Column(db.Integer)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+    def __repr__(self):
+        return f'<RosterChange {self.id} member={self.member_id} user={self.user_id}>'
+
+
 class TokenBlocklist(db.Model):
     """Blocklist for revoked JWT tokens"""
     __tablename__ = 'token_blocklist'
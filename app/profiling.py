@@ -0,0 +1,311 @@
+"""
+Alliance Management System - On-demand Request Profiling
+Admin-only cProfile / sampling profiles with captured SQL, written to a local directory
+"""
+import cProfile
+import json
+import os
+import pstats
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+from flask import g, request, jsonify, send_from_directory, has_request_context
+from flask_jwt_extended import jwt_required, get_jwt, verify_jwt_in_request
+from flask_login import current_user
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app import (app, PROFILING_ENABLED, PROFILE_SAMPLE_RATE, PROFILE_DIR,
+                 PROFILE_MAX_CAPTURES, PROFILE_SQL_PARAMS)
+
+PROFILE_HEADER = 'X-Profile'
+PROFILE_QUERY_ARG = '_profile'
+PROFILE_MODES = ('cprofile', 'sample')
+# Accepted flag values -> mode; anything else (e.g. '0', 'false') is ignored
+PROFILE_FLAGS = {'1': 'cprofile', 'true': 'cprofile', 'cprofile': 'cprofile', 'sample': 'sample'}
+SAMPLE_INTERVAL = 0.005  # Seconds between stack samples in 'sample' mode
+
+# Capture files are named <timestamp>-<method>-<path>.<ext>
+PROFILE_FILE_RE = re.compile(r'^[\w.-]+\.(prof|folded|json)$')
+
+
+class StackSampler:
+    """Statistical profiler - periodically samples one thread's stack"""
+
+    def __init__(self, thread_id, interval=SAMPLE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})')
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def folded(self):
+        """Stacks in the folded format read by flamegraph.pl and speedscope"""
+        return '\n'.join(f'{stack} {count}' for stack, count in self.stacks.most_common()) + '\n'
+
+
+def _is_admin():
+    """True if the request carries an admin JWT or an admin web session"""
+    try:
+        if verify_jwt_in_request(optional=True) and get_jwt().get('role') == 'admin':
+            return True
+    except Exception:
+        # Invalid/expired tokens are reported by the route itself, not here
+        pass
+    return current_user.is_authenticated and current_user.role == 'admin'
+
+
+def _requested_mode():
+    """Profiling mode asked for by header/query flag, or None"""
+    flag = request.headers.get(PROFILE_HEADER) or request.args.get(PROFILE_QUERY_ARG) or ''
+    return PROFILE_FLAGS.get(flag.strip().lower())
+
+
+def _capture_name():
+    """Filesystem-safe base name for this request's capture files"""
+    stamp = datetime.utcnow().strftime('%Y%m%dT%H%M%S%f')
+    path = re.sub(r'[^\w-]+', '_', request.path.strip('/')) or 'root'
+    return f'{stamp}-{request.method}-{path}'
+
+
+def start_profiling():
+    """Start profiling the current request if it opted in or was sampled"""
+    mode = _requested_mode()
+    if mode is not None:
+        if not _is_admin():
+            return
+        sampled = False
+    elif PROFILE_SAMPLE_RATE and random.random() < PROFILE_SAMPLE_RATE:
+        mode = PROFILE_MODES[0]
+        sampled = True
+    else:
+        return
+
+    if mode == 'sample':
+        profiler = StackSampler(threading.get_ident())
+        profiler.start()
+    else:
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Another profiler is already active on this thread
+            return
+
+    g.profile = {
+        'mode': mode,
+        'profiler': profiler,
+        'queries': [],
+        'sampled': sampled,
+        # Parameters can hold password hashes, emails etc. - opt-in, and never for sampled requests
+        'sql_params': PROFILE_SQL_PARAMS and not sampled,
+        'started': time.perf_counter(),
+    }
+
+
+def _stop_profiler(profile):
+    if profile['mode'] == 'sample':
+        profile['profiler'].stop()
+    else:
+        profile['profiler'].disable()
+
+
+def finish_profiling(response):
+    """Stop the profiler and write its capture files"""
+    profile = g.pop('profile', None)
+    if profile is None:
+        return response
+
+    _stop_profiler(profile)
+    elapsed = time.perf_counter() - profile['started']
+
+    name = _capture_name()
+    try:
+        _write_capture(name, profile, elapsed, response)
+        _prune_captures()
+    except OSError:
+        # A full disk or bad permissions must never fail the profiled request
+        app.logger.exception('Could not write profile capture %s', name)
+        return response
+
+    response.headers['X-Profile-Id'] = name
+    return response
+
+
+def _write_capture(name, profile, elapsed, response):
+    """Write the profiler output and the JSON summary for one request"""
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+
+    if profile['mode'] == 'sample':
+        with open(os.path.join(PROFILE_DIR, f'{name}.folded'), 'w', encoding='utf-8') as f:
+            f.write(profile['profiler'].folded())
+    else:
+        profile['profiler'].dump_stats(os.path.join(PROFILE_DIR, f'{name}.prof'))
+
+    summary = {
+        'name': name,
+        'mode': profile['mode'],
+        'method': request.method,
+        'sampled': profile['sampled'],
+        # Sampled requests can come from anyone and query strings may carry tokens or personal data
+        'path': request.path if profile['sampled'] else request.full_path.rstrip('?'),
+        'status': response.status_code,
+        'duration_ms': round(elapsed * 1000, 3),
+        'sql_count': len(profile['queries']),
+        'sql_ms': round(sum(q['duration_ms'] for q in profile['queries']), 3),
+        'queries': profile['queries'],
+    }
+    with open(os.path.join(PROFILE_DIR, f'{name}.json'), 'w', encoding='utf-8') as f:
+        json.dump(summary, f, indent=2)
+
+
+def _prune_captures():
+    """Delete the oldest captures beyond PROFILE_MAX_CAPTURES"""
+    captures = {}
+    for filename in os.listdir(PROFILE_DIR):
+        if PROFILE_FILE_RE.match(filename):
+            captures.setdefault(filename.rsplit('.', 1)[0], []).append(filename)
+
+    # Names start with a UTC timestamp, so they sort oldest first
+    for name in sorted(captures)[:-max(PROFILE_MAX_CAPTURES, 1)]:
+        for filename in captures[name]:
+            try:
+                os.remove(os.path.join(PROFILE_DIR, filename))
+            except FileNotFoundError:
+                pass
+
+
+def abort_profiling(exc):
+    """Make sure a profiler never outlives its request (e.g. on unhandled errors)"""
+    profile = g.pop('profile', None)
+    if profile is not None:
+        _stop_profiler(profile)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and 'profile' in g:
+        # Stored per execution, so a failed statement can't skew later timings
+        context._profile_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, '_profile_start', None)
+    if started is None or not has_request_context() or 'profile' not in g:
+        return
+    query = {
+        'statement': statement,
+        'duration_ms': round((time.perf_counter() - started) * 1000, 3),
+    }
+    if g.profile['sql_params']:
+        query['parameters'] = repr(parameters)
+    g.profile['queries'].append(query)
+
+
+# Hooks are only installed when profiling is enabled, so disabled costs nothing
+if PROFILING_ENABLED:
+    app.before_request(start_profiling)
+    app.after_request(finish_profiling)
+    app.teardown_request(abort_profiling)
+    event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+
+
+# ============================================
+# PROFILE LISTING (Admin only)
+# ============================================
+
+@app.route('/api/profiles', methods=['GET'])
+@jwt_required()
+def list_profiles():
+    """List captured profiles (newest first) - admin only"""
+    claims = get_jwt()
+    if claims.get('role') != 'admin':
+        return jsonify({'error': 'Admin access required'}), 403
+
+    profiles = []
+    if os.path.isdir(PROFILE_DIR):
+        for filename in sorted(os.listdir(PROFILE_DIR), reverse=True):
+            if not filename.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(PROFILE_DIR, filename), encoding='utf-8') as f:
+                    summary = json.load(f)
+            except (OSError, ValueError):
+                # Pruned or half-written while we were listing
+                continue
+            summary.pop('queries', None)
+            ext = 'folded' if summary['mode'] == 'sample' else 'prof'
+            summary['files'] = [f"{summary['name']}.{ext}", filename]
+            profiles.append(summary)
+
+    return jsonify({
+        'success': True,
+        'enabled': PROFILING_ENABLED,
+        'count': len(profiles),
+        'profiles': profiles
+    }), 200
+
+
+@app.route('/api/profiles/<filename>', methods=['GET'])
+@jwt_required()
+def get_profile(filename):
+    """Download a capture file - admin only (?format=folded converts .prof)"""
+    claims = get_jwt()
+    if claims.get('role') != 'admin':
+        return jsonify({'error': 'Admin access required'}), 403
+
+    if not PROFILE_FILE_RE.match(filename):
+        return jsonify({'error': 'Invalid profile name'}), 400
+
+    if filename.endswith('.prof') and request.args.get('format') == 'folded':
+        path = os.path.join(PROFILE_DIR, filename)
+        if not os.path.isfile(path):
+            return jsonify({'error': 'Profile not found'}), 404
+        return app.response_class(prof_to_folded(path), mimetype='text/plain')
+
+    return send_from_directory(PROFILE_DIR, filename, as_attachment=True)
+
+
+def prof_to_folded(path):
+    """
+    Convert a cProfile dump to folded stacks.
+    cProfile only records caller->callee pairs, so each line is a two-frame
+    stack weighted by the callee's own time in microseconds.
+    """
+    stats = pstats.Stats(path).stats
+    lines = []
+    for (filename, line, func), (_, _, tottime, _, callers) in stats.items():
+        callee = f'{func} ({os.path.basename(filename)}:{line})'
+        if not callers:
+            weight = int(tottime * 1_000_000)
+            if weight:
+                lines.append(f'{callee} {weight}')
+            continue
+        for (c_file, c_line, c_func), caller_stats in callers.items():
+            weight = int(caller_stats[2] * 1_000_000)
+            if weight:
+                lines.append(f'{c_func} ({os.path.basename(c_file)}:{c_line});{callee} {weight}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,461 @@
+"""
+Alliance Management System - In-memory Roster Snapshot
+Per-worker columnar copy of the members table that answers read queries without the ORM
+"""
+import math
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from datetime import datetime, timedelta
+
+import click
+from flask import abort
+from flask.cli import AppGroup
+from sqlalchemy import delete, event, func, select
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session, object_session
+
+from app import app, db, ROSTER_SNAPSHOT, ROSTER_REFRESH_INTERVAL, ROSTER_CHANGE_RETENTION
+from app.models import Member, RosterChange, User
+
+EPOCH = datetime(1970, 1, 1)
+NO_TIMESTAMP = float('nan')
+
+# Above this share of changed rows a full reload is cheaper than patching
+FULL_RELOAD_RATIO = 0.5
+
+# Seconds between attempts to prune old roster_changes rows
+PRUNE_INTERVAL = 60
+
+
+class CreatorRecord:
+    """Lightweight stand-in for the User shown as a member's creator"""
+    __slots__ = ('id', 'username', 'role')
+
+    def __init__(self, id, username, role):
+        self.id = id
+        self.username = username
+        self.role = role
+
+
+class MemberRecord:
+    """Read-only member row with the same attributes templates and schemas use on Member"""
+    __slots__ = ('id', 'name', 'email', 'role', 'phone', 'created_at', 'user_id', 'creator')
+
+    def __init__(self, id, name, email, role, phone, created_at, user_id, creator):
+        self.id = id
+        self.name = name
+        self.email = email
+        self.role = role
+        self.phone = phone
+        self.created_at = created_at
+        self.user_id = user_id
+        self.creator = creator
+
+
+def _to_timestamp(value):
+    return (value - EPOCH).total_seconds() if value is not None else NO_TIMESTAMP
+
+
+def _from_timestamp(value):
+    return None if math.isnan(value) else EPOCH + timedelta(microseconds=round(value * 1_000_000))
+
+
+class RosterSnapshot:
+    """
+    Columnar snapshot of the members table, sorted by id.
+    Ids, creator ids and timestamps live in typed arrays, roles are interned
+    and stored as small integer codes, and creators are shared per user.
+    """
+
+    def __init__(self):
+        self.ids = array('q')
+        self.user_ids = array('q')
+        self.created = array('d')
+        self.role_codes = array('H')
+        self.names = []
+        self.emails = []
+        self.phones = []
+
+        self.role_names = []      # code -> interned role string
+        self.role_lookup = {}     # role string -> code
+        self.creators = {}        # user id -> CreatorRecord
+
+        self.version = None       # Last RosterChange id applied
+        self.checked_at = 0.0
+        # Bumped after this worker commits a roster write; refresh() catches up right away
+        self.invalidations = 0
+        self.seen_invalidations = 0
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.ids)
+
+    # ---------- loading ----------
+
+    def _role_code(self, role):
+        code = self.role_lookup.get(role)
+        if code is None:
+            code = len(self.role_names)
+            role = sys.intern(role)
+            self.role_names.append(role)
+            self.role_lookup[role] = code
+        return code
+
+    def _clear(self):
+        for column in (self.ids, self.user_ids, self.created, self.role_codes):
+            del column[:]
+        self.names.clear()
+        self.emails.clear()
+        self.phones.clear()
+
+    def _insert(self, row):
+        """Insert one members row (id, name, email, role, phone, created_at, user_id) in id order"""
+        member_id, name, email, role, phone, created_at, user_id = row
+        index = bisect_left(self.ids, member_id)
+        self.ids.insert(index, member_id)
+        self.user_ids.insert(index, user_id)
+        self.created.insert(index, _to_timestamp(created_at))
+        self.role_codes.insert(index, self._role_code(role))
+        self.names.insert(index, name)
+        self.emails.insert(index, email)
+        self.phones.insert(index, phone)
+
+    def _remove(self, member_id):
+        index = self._index(member_id)
+        if index is None:
+            return
+        for column in (self.ids, self.user_ids, self.created, self.role_codes,
+                       self.names, self.emails, self.phones):
+            del column[index]
+
+    def _sync_creators(self, changed_user_ids=()):
+        """Load creators for new members, re-read changed users and drop unreferenced ones"""
+        referenced = set(self.user_ids)
+        for user_id in self.creators.keys() - referenced:
+            del self.creators[user_id]
+
+        wanted = (referenced - self.creators.keys()) | (referenced & set(changed_user_ids))
+        if not wanted:
+            return
+        for user_id in wanted:
+            # Deleted users simply stay missing
+            self.creators.pop(user_id, None)
+        rows = db.session.execute(
+            select(User.id, User.username, User.role).where(User.id.in_(wanted))
+        )
+        for user_id, username, role in rows:
+            self.creators[user_id] = CreatorRecord(user_id, username, sys.intern(role))
+
+    def _member_rows(self, member_ids=None):
+        table = Member.__table__
+        query = select(table.c.id, table.c.name, table.c.email, table.c.role,
+                       table.c.phone, table.c.created_at, table.c.user_id)
+        if member_ids is not None:
+            query = query.where(table.c.id.in_(member_ids))
+        return db.session.execute(query).all()
+
+    def reload(self):
+        """Rebuild the whole snapshot from the members table"""
+        with self._lock:
+            # Read the version first - changes racing the load are simply re-applied later
+            version = db.session.execute(select(func.max(RosterChange.id))).scalar() or 0
+            rows = self._member_rows()
+            self._clear()
+            self.creators.clear()
+            for row in sorted(rows):
+                self._insert(row)
+            self._sync_creators()
+            self.version = version
+
+    def refresh(self):
+        """Apply roster changes recorded since the last refresh"""
+        with self._lock:
+            now = time.monotonic()
+            invalidations = self.invalidations
+            if (invalidations == self.seen_invalidations
+                    and now - self.checked_at < ROSTER_REFRESH_INTERVAL):
+                return
+            self.checked_at = now
+            self.seen_invalidations = invalidations
+
+            if self.version is None:
+                self.reload()
+                return
+
+            changes = db.session.execute(
+                select(RosterChange.id, RosterChange.member_id, RosterChange.user_id)
+                .where(RosterChange.id > self.version)
+                .order_by(RosterChange.id)
+            ).all()
+            if not changes:
+                return
+
+            # SQLite serializes writers, so ids are committed in order without gaps
+            # (hence the startup check below). A gap means entries were pruned.
+            if changes[0].id > self.version + 1:
+                self.reload()
+                return
+
+            member_ids = {c.member_id for c in changes if c.member_id is not None}
+            user_ids = {c.user_id for c in changes if c.user_id is not None}
+            if len(member_ids) > len(self) * FULL_RELOAD_RATIO:
+                self.reload()
+                return
+
+            for member_id in member_ids:
+                self._remove(member_id)
+            if member_ids:
+                for row in self._member_rows(member_ids):
+                    self._insert(row)
+            self._sync_creators(user_ids)
+            self.version = changes[-1].id
+
+    # ---------- queries ----------
+
+    def _index(self, member_id):
+        index = bisect_left(self.ids, member_id)
+        if index < len(self.ids) and self.ids[index] == member_id:
+            return index
+        return None
+
+    def _record(self, index):
+        user_id = self.user_ids[index]
+        return MemberRecord(
+            self.ids[index],
+            self.names[index],
+            self.emails[index],
+            self.role_names[self.role_codes[index]],
+            self.phones[index],
+            _from_timestamp(self.created[index]),
+            user_id,
+            self.creators.get(user_id),
+        )
+
+    def _role_indexes(self, role):
+        code = self.role_lookup.get(role)
+        if code is None:
+            return []
+        return [i for i, c in enumerate(self.role_codes) if c == code]
+
+    def all(self, role=None):
+        with self._lock:
+            indexes = range(len(self.ids)) if role is None else self._role_indexes(role)
+            return [self._record(i) for i in indexes]
+
+    def get(self, member_id):
+        with self._lock:
+            index = self._index(member_id)
+            return None if index is None else self._record(index)
+
+    def count(self, role=None):
+        with self._lock:
+            if role is None:
+                return len(self.ids)
+            code = self.role_lookup.get(role)
+            return 0 if code is None else self.role_codes.count(code)
+
+    def memory_usage(self):
+        """Approximate bytes held by the snapshot (columns, strings and creators)"""
+        with self._lock:
+            total = sum(sys.getsizeof(column) for column in (
+                self.ids, self.user_ids, self.created, self.role_codes,
+                self.names, self.emails, self.phones, self.role_names, self.role_lookup,
+                self.creators))
+            for column in (self.names, self.emails, self.phones):
+                total += sum(sys.getsizeof(value) for value in column if value is not None)
+            total += sum(sys.getsizeof(role) for role in self.role_names)
+            for creator in self.creators.values():
+                total += sys.getsizeof(creator) + sys.getsizeof(creator.username)
+            return total
+
+
+snapshot = RosterSnapshot()
+
+
+# ============================================
+# READ API (used by routes)
+# ============================================
+
+def list_members(role=None):
+    """All members, optionally filtered by role"""
+    if ROSTER_SNAPSHOT:
+        snapshot.refresh()
+        return snapshot.all(role)
+    query = Member.query
+    if role is not None:
+        query = query.filter_by(role=role)
+    return query.all()
+
+
+def get_member_or_404(member_id):
+    """Single member by id, aborting with 404 if it does not exist"""
+    if ROSTER_SNAPSHOT:
+        snapshot.refresh()
+        member = snapshot.get(member_id)
+        if member is None:
+            abort(404)
+        return member
+    return Member.query.get_or_404(member_id)
+
+
+# ============================================
+# CHANGE TRACKING
+# ============================================
+
+def prune_changes():
+    """
+    Delete roster_changes rows older than ROSTER_CHANGE_RETENTION seconds.
+    The newest row is always kept so the version never goes backwards; a worker
+    that falls behind the pruned range notices the gap and does a full reload.
+    """
+    table = RosterChange.__table__
+    cutoff = datetime.utcnow() - timedelta(seconds=ROSTER_CHANGE_RETENTION)
+    newest = select(func.max(table.c.id)).scalar_subquery()
+    try:
+        with db.engine.begin() as connection:
+            connection.execute(delete(table).where(table.c.created_at < cutoff,
+                                                   table.c.id < newest))
+    except OperationalError:
+        # e.g. SQLite busy - just try again after a later write
+        app.logger.warning('Could not prune roster_changes', exc_info=True)
+
+
+_pruned_at = 0.0
+
+
+def _record_member_change(mapper, connection, target):
+    """Log the changed member id so every worker can patch its snapshot"""
+    connection.execute(RosterChange.__table__.insert().values(member_id=target.id))
+    object_session(target).info['roster_changed'] = True
+
+
+def _record_user_change(mapper, connection, target):
+    """Log the changed user id so cached creator records get re-read"""
+    connection.execute(RosterChange.__table__.insert().values(user_id=target.id))
+    object_session(target).info['roster_changed'] = True
+
+
+def _after_commit(session):
+    global _pruned_at
+    # Only invalidate once the change rows are visible to other connections
+    if not session.info.pop('roster_changed', False):
+        return
+    snapshot.invalidations += 1
+
+    # Prune from the write path, outside the snapshot lock, so reads never wait on it
+    now = time.monotonic()
+    if now - _pruned_at >= PRUNE_INTERVAL:
+        _pruned_at = now
+        prune_changes()
+
+
+def _after_rollback(session):
+    session.info.pop('roster_changed', None)
+
+
+# Change tracking is only needed when snapshots are in use
+if ROSTER_SNAPSHOT:
+    with app.app_context():
+        # Versions are roster_changes ids. Only SQLite guarantees they become visible
+        # in id order without gaps; with sequences a late commit could be skipped.
+        if db.engine.dialect.name != 'sqlite':
+            raise RuntimeError('ROSTER_SNAPSHOT requires SQLite '
+                               f'(database is {db.engine.dialect.name})')
+        RosterChange.__table__.create(db.engine, checkfirst=True)
+
+    for _event in ('after_insert', 'after_update', 'after_delete'):
+        event.listen(Member, _event, _record_member_change)
+        event.listen(User, _event, _record_user_change)
+    event.listen(Session, 'after_commit', _after_commit)
+    event.listen(Session, 'after_rollback', _after_rollback)
+
+
+# ============================================
+# CLI: flask roster init / prune / stats
+# ============================================
+
+roster_cli = AppGroup('roster', help='Manage the in-memory roster snapshot.')
+
+
+@roster_cli.command('init')
+def init_command():
+    """Create the roster_changes table in an existing database"""
+    RosterChange.__table__.create(db.engine, checkfirst=True)
+    click.echo('roster_changes table ready')
+
+
+@roster_cli.command('prune')
+def prune_command():
+    """Delete roster_changes rows older than ROSTER_CHANGE_RETENTION"""
+    prune_changes()
+    click.echo('roster_changes pruned')
+
+
+def _best_of(fn, repeat):
+    """Fastest of `repeat` runs in milliseconds"""
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+
+@roster_cli.command('stats')
+@click.option('--repeat', default=20, help='Runs per measurement (best is reported).')
+def stats_command(repeat):
+    """Report snapshot memory per member and latency against the ORM path"""
+    snapshot.reload()
+    count = len(snapshot)
+    memory = snapshot.memory_usage()
+    click.echo(f'Members: {count}')
+    click.echo(f'Snapshot memory: {memory / 1024:.1f} KiB'
+               + (f' ({memory / count:.0f} bytes/member)' if count else ''))
+
+    sample_id = snapshot.ids[count // 2] if count else 0
+    sample_role = snapshot.role_names[0] if snapshot.role_names else 'Member'
+
+    def orm_list():
+        members = Member.query.all()
+        for member in members:
+            member.creator  # Lazy load, as the schema does
+        db.session.expunge_all()
+
+    def orm_filter():
+        members = Member.query.filter_by(role=sample_role).all()
+        for member in members:
+            member.creator
+        db.session.expunge_all()
+
+    def orm_get():
+        db.session.get(Member, sample_id)
+        db.session.expunge_all()
+
+    def from_snapshot(query):
+        # Include the refresh check every live read pays
+        def run():
+            snapshot.refresh()
+            return query()
+        return run
+
+    benchmarks = [
+        ('list', orm_list, from_snapshot(snapshot.all)),
+        ('filter by role', orm_filter, from_snapshot(lambda: snapshot.all(sample_role))),
+        ('lookup by id', orm_get, from_snapshot(lambda: snapshot.get(sample_id))),
+        ('count', lambda: Member.query.count(), from_snapshot(snapshot.count)),
+        ('count by role', lambda: Member.query.filter_by(role=sample_role).count(),
+         from_snapshot(lambda: snapshot.count(sample_role))),
+    ]
+
+    click.echo(f'{"query":<16}{"orm ms":>10}{"snapshot ms":>14}{"speedup":>10}')
+    for label, orm_fn, snapshot_fn in benchmarks:
+        orm_ms = _best_of(orm_fn, repeat)
+        snapshot_ms = _best_of(snapshot_fn, repeat)
+        speedup = orm_ms / snapshot_ms if snapshot_ms else float('inf')
+        click.echo(f'{label:<16}{orm_ms:>10.3f}{snapshot_ms:>14.3f}{speedup:>9.1f}x')
+
+
+app.cli.add_command(roster_cli)
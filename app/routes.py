@@ -5,6 +5,7 @@ from flask_login import login_user, logout_user, login_required, current_user
 from app import app, db, APP_NAME, bcrypt
 from app.models import Member, User
 from app.schemas import member_schema, members_schema
+from app.roster import list_members, get_member_or_404
 from app.forms import MemberForm, ExtendedMemberForm, LoginForm
 from marshmallow import ValidationError
 
@@ -62,8 +63,8 @@ def web_logout():
 @app.route('/members')
 @login_required
 def members():
-    """Display all members from database"""
-    all_members = Member.query.all()
+    """Display all members (from the roster snapshot when enabled)"""
+    all_members = list_members()
     return render_template('members.html', title='Members', members=all_members, app_name=APP_NAME)
 
 
@@ -150,7 +151,7 @@ def submit_extended():
 @jwt_required()
 def get_member(member_id):
     """Get single member by ID (for hyperlink in schema)"""
-    member = Member.query.get_or_404(member_id)
+    member = get_member_or_404(member_id)
     return member_schema.jsonify(member), 200
 
 
@@ -164,8 +165,8 @@ class MembersAPI(MethodView):
     decorators = [jwt_required()]  # Require JWT for all methods
 
     def get(self):
-        """Get all members - accessible by both user and admin"""
-        all_members = Member.query.all()
+        """Get all members (optionally ?role=Officer) - accessible by both user and admin"""
+        all_members = list_members(role=request.args.get('role'))
         return jsonify({
             'success': True,
             'count': len(all_members),